@@ -4,9 +4,14 @@ import json
 import numpy as np
 import cv2
 from event import Event
+from framearchive import FrameArchiveWriter
 
 MIN_CALIBRATION_FRAMES = 20
 
+# camera models
+PINHOLE = "pinhole"
+FISHEYE = "fisheye"
+
 class CameraCalibration():
     """This class performs camera calibration."""
 
@@ -15,11 +20,26 @@ class CameraCalibration():
         self.record_min_num_frames = MIN_CALIBRATION_FRAMES
         self.record_cnt = 0
         self._recording = False
+        self._model = PINHOLE
         self._mean_error = 0
         self._is_calibrated = False
         self._camera_matrix = None
         self._dist_coeff = None
         self._calibration_file = None
+        self._maps = {}
+
+        # fisheye undistortion settings: output frame size (None for the input
+        # frame size), balance between cropping (0) and keeping all pixels (1),
+        # and field of view scale (greater than 1 zooms out)
+        self.output_size = None
+        self.balance = 0.0
+        self.fov_scale = 1.0
+
+        # archive path without extension; if set, the grayscale frames processed
+        # while recording are appended to the archive for replay(), each
+        # calibration run as a new archive session
+        self.archive_path = None
+        self._archive = None
 
         # events
         self.calibrated = Event()
@@ -30,10 +50,20 @@ class CameraCalibration():
         self.img_points = []
 
         # prepare object points
+        self.objp = None
+        self.prepare_object_points()
+
+    def prepare_object_points(self):
+        """Prepare chessboard corner coordinates for the chessboard size."""
         self.objp = np.zeros((np.prod(self.chessboard_size), 3), dtype=np.float32)
         self.objp[:, :2] = np.mgrid[0:self.chessboard_size[0],
                                     0:self.chessboard_size[1]].T.reshape(-1, 2)
 
+    @property
+    def model(self):
+        """Camera model: PINHOLE or FISHEYE."""
+        return self._model
+
     @property
     def mean_error(self):
         """Mean re-projection error."""
@@ -75,8 +105,24 @@ class CameraCalibration():
         self.obj_points = []
         self.img_points = []
 
-    def start_calibration(self):
-        """Start camera calibration process."""
+    def start_calibration(self, model=None):
+        """Start camera calibration process.
+
+        Args:
+            model (str): Camera model, PINHOLE or FISHEYE. Default is the current model.
+        """
+        self._start_recording(model)
+        if self.archive_path:
+            self._archive = FrameArchiveWriter(self.archive_path)
+
+    def _start_recording(self, model):
+        """Reset recorded data and enable recording mode."""
+        self._close_archive()
+        if model is not None:
+            if model not in (PINHOLE, FISHEYE):
+                raise ValueError(f"Unknown camera model '{model}'.")
+            self._model = model
+        self.prepare_object_points()
         self.reset_recording()
         self._recording = True
         self._is_calibrated = False
@@ -86,8 +132,44 @@ class CameraCalibration():
         """Cancel camera calibration process."""
         self._recording = False
         self._is_calibrated = False
+        self._close_archive()
         self.reset_recording()
 
+    def _close_archive(self):
+        """Close the archive of the recorded frames."""
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def find_corners(self, frame):
+        """Find chessboard corners in a frame.
+
+        Args:
+            frame (image): input BGR or grayscale image.
+        Returns:
+            refined corner positions, or None if the chessboard was not found.
+        """
+        if frame.ndim == 2:
+            img_gray = frame
+        else:
+            img_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.uint8)
+        flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE
+        if self._model == FISHEYE:
+            # strong distortion near the edges of wide-angle frames produces
+            # false quads, which are filtered out by their area and shape
+            flags += cv2.CALIB_CB_FILTER_QUADS
+        ret, corners = cv2.findChessboardCorners(img_gray, self.chessboard_size, flags=flags)
+        if not ret:
+            return None
+
+        # refine found corners.
+        # process of corner position refinement stops either after
+        # criteria maxCount iterations or when the corner position moves
+        # by less than criteria epsilon on some iteration.
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+        cv2.cornerSubPix(img_gray, corners, (9, 9), (-1, -1), criteria)
+        return corners.reshape(-1, 1, 2)
+
     def calibrate(self, frame):
         """Processes each frame.
 
@@ -101,54 +183,123 @@ class CameraCalibration():
         if self.record_cnt < self.record_min_num_frames:
 
             img_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY).astype(np.uint8)
-            ret, corners = cv2.findChessboardCorners(img_gray, self.chessboard_size, None)
-            if ret:
-                cv2.drawChessboardCorners(frame, self.chessboard_size, corners, ret)
-
-                # refine found corners.
-                # process of corner position refinement stops either after
-				# criteria maxCount iterations or when the corner position moves
-				# by less than criteria epsilon on some iteration.
-                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
-                cv2.cornerSubPix(img_gray, corners, (9, 9), (-1, -1), criteria)
-
-                self.obj_points.append(self.objp)
-                self.img_points.append(corners)
-                self.record_cnt += 1
-
-                # report progress
-                message = "%d of %d frames" % (self.record_cnt, self.record_min_num_frames)
-                self.on_progress(message)
-        else:
-            # calculate the intrinsic camera matrix (k) and the distortion vector (dist)
-            self._recording = False
-            image_height, image_width = frame.shape[:2]
+            corners = self.find_corners(img_gray)
+            if self._archive is not None:
+                self._archive.append(img_gray, corners is not None)
 
-            # get the camera matrix, distortion coefficients, rotation and translation vectors
-            ret, k, dist, rvecs, tvecs = cv2.calibrateCamera(
-                self.obj_points, self.img_points,
-                (image_height, image_width),
-                None, None)
+            if corners is not None:
+                cv2.drawChessboardCorners(frame, self.chessboard_size, corners, True)
+                self._add_corners(corners)
+        else:
+            self._finish_calibration(frame.shape[:2])
 
-            self._camera_matrix = k
-            self._dist_coeff = dist
+    def replay(self, archive, model=None):
+        """Run calibration on frames replayed from an archive, e.g. to detect the
+        chessboard again with another chessboard size or camera model.
 
-            # calculate re-projection error.
-            # this should be as close to zero as possible.
-            self._mean_error = 0
+        Args:
+            archive (FrameArchive): recorded grayscale frames.
+            model (str): Camera model, PINHOLE or FISHEYE. Default is the current model.
+        Returns:
+            True if the camera was calibrated.
+        """
+        self._start_recording(model)
+        frame = None
+        for frame in archive:
+            if self.record_cnt >= self.record_min_num_frames:
+                break
+            corners = self.find_corners(frame)
+            if corners is not None:
+                self._add_corners(corners)
+
+        if frame is None or self.record_cnt < self.record_min_num_frames:
+            self.cancel_calibration()
+            return False
+
+        self._finish_calibration(frame.shape[:2])
+        return self._is_calibrated
 
-            for i in range(len(self.obj_points)):
-                # transform the object points to image points.
-                img_points2, _ = cv2.projectPoints(self.obj_points[i], rvecs[i], tvecs[i], k, dist)
+    def _add_corners(self, corners):
+        """Record chessboard corners found in a frame."""
+        self.obj_points.append(self.objp)
+        self.img_points.append(corners)
+        self.record_cnt += 1
 
-                # calculate the absolute norm between what we got with our transformation
-                # and the corner finding algorithm.
-                error = cv2.norm(self.img_points[i], img_points2, cv2.NORM_L2) / len(img_points2)
-                self._mean_error += error
+        # report progress
+        message = "%d of %d frames" % (self.record_cnt, self.record_min_num_frames)
+        self.on_progress(message)
 
+    def _finish_calibration(self, frame_shape):
+        """Calculate camera parameters from the recorded points."""
+        # calculate the intrinsic camera matrix (k) and the distortion vector (dist)
+        self._recording = False
+        self._close_archive()
+        image_height, image_width = frame_shape
+
+        try:
+            if self._model == FISHEYE:
+                self._solve_fisheye((image_width, image_height))
+            else:
+                self._solve_pinhole((image_width, image_height))
             self._is_calibrated = True
-            self.reset_recording()
-            self.calibrated()
+        except cv2.error:
+            # the solver fails on degenerate chessboard views,
+            # the calibrated event reports the camera as not calibrated
+            self._is_calibrated = False
+
+        self.reset_recording()
+        self.calibrated()
+
+    def _solve_pinhole(self, image_size):
+        """Calculate pinhole camera parameters from the recorded points."""
+        # get the camera matrix, distortion coefficients, rotation and translation vectors
+        ret, k, dist, rvecs, tvecs = cv2.calibrateCamera(
+            self.obj_points, self.img_points,
+            image_size,
+            None, None)
+
+        self._camera_matrix = k
+        self._dist_coeff = dist
+        self._maps = {}
+
+        # calculate re-projection error.
+        # this should be as close to zero as possible.
+        self._mean_error = 0
+
+        for i in range(len(self.obj_points)):
+            # transform the object points to image points.
+            img_points2, _ = cv2.projectPoints(self.obj_points[i], rvecs[i], tvecs[i], k, dist)
+
+            # calculate the absolute norm between what we got with our transformation
+            # and the corner finding algorithm.
+            error = cv2.norm(self.img_points[i], img_points2, cv2.NORM_L2) / len(img_points2)
+            self._mean_error += error
+
+    def _solve_fisheye(self, image_size):
+        """Calculate fisheye camera parameters from the recorded points."""
+        # the fisheye solver expects 1xNx3 object points and 1xNx2 image points
+        obj_points = [p.reshape(1, -1, 3).astype(np.float64) for p in self.obj_points]
+        img_points = [p.reshape(1, -1, 2).astype(np.float64) for p in self.img_points]
+
+        # fisheye flags were moved from cv2.fisheye to cv2 in OpenCV 5
+        flags_module = cv2.fisheye if hasattr(cv2.fisheye, "CALIB_FIX_SKEW") else cv2
+        flags = flags_module.CALIB_RECOMPUTE_EXTRINSIC + flags_module.CALIB_FIX_SKEW
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-6)
+        ret, k, dist, rvecs, tvecs = cv2.fisheye.calibrate(
+            obj_points, img_points, image_size, None, None,
+            flags=flags, criteria=criteria)
+
+        self._camera_matrix = k
+        self._dist_coeff = dist
+        self._maps = {}
+
+        # calculate re-projection error.
+        self._mean_error = 0
+
+        for i in range(len(obj_points)):
+            img_points2, _ = cv2.fisheye.projectPoints(obj_points[i], rvecs[i], tvecs[i], k, dist)
+            error = cv2.norm(img_points[i], img_points2, cv2.NORM_L2) / img_points2.shape[1]
+            self._mean_error += error
 
     def undistort(self, frame):
         """Undistort a frame.
@@ -157,28 +308,65 @@ class CameraCalibration():
             frame (image): input image: 8-bit unsigned, 16-bit unsigned,
             or single-precision floating-point.
         Returns:
-            undistorted frame of the same size as the original one.
+            undistorted frame of the same size as the original one, or of
+            output_size for the fisheye model.
         """
         if not self._is_calibrated:
             return frame
 
+        if self._model == FISHEYE:
+            height, width = frame.shape[:2]
+            map1, map2 = self._fisheye_maps((width, height))
+            return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+
         # undistort
         height, width = frame.shape[:2]
-        size = (width, height)
-        new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(
-            self._camera_matrix, self._dist_coeff, size, 1, size)
-        dst = cv2.undistort(frame, self._camera_matrix, self._dist_coeff, None, new_camera_matrix)
+        map1, map2, roi = self._undistort_maps((width, height))
+        dst = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
 
         # crop the image
         x, y, w, h = roi
-        dst = dst[y:y+h, x:x+w]
-        new_image = np.zeros((height, width, 3), np.uint8)
-        new_image[y:y+h, x:x+w] = dst
+        new_image = np.zeros_like(frame)
+        new_image[y:y+h, x:x+w] = dst[y:y+h, x:x+w]
         return new_image
 
+    def _undistort_maps(self, size):
+        """Get undistortion maps for the frame size, computing them on first use."""
+        maps = self._maps.get(size)
+        if maps is None:
+            new_camera_matrix, roi = cv2.getOptimalNewCameraMatrix(
+                self._camera_matrix, self._dist_coeff, size, 1, size)
+            map1, map2 = cv2.initUndistortRectifyMap(
+                self._camera_matrix, self._dist_coeff, None, new_camera_matrix,
+                size, cv2.CV_16SC2)
+            maps = (map1, map2, roi)
+            self._maps[size] = maps
+        return maps
+
+    def _fisheye_maps(self, size):
+        """Get fisheye rectification maps for the frame size and the current
+        output settings, computing them on first use.
+
+        Maps of large outputs take tens of megabytes, so only the maps of the
+        current settings are kept.
+        """
+        output_size = tuple(self.output_size or size)
+        key = (size, output_size, self.balance, self.fov_scale)
+        maps = self._maps.get(key)
+        if maps is None:
+            new_camera_matrix = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(
+                self._camera_matrix, self._dist_coeff, size, np.eye(3),
+                balance=self.balance, new_size=output_size, fov_scale=self.fov_scale)
+            maps = cv2.fisheye.initUndistortRectifyMap(
+                self._camera_matrix, self._dist_coeff, np.eye(3), new_camera_matrix,
+                output_size, cv2.CV_16SC2)
+            self._maps = {key: maps}
+        return maps
+
     def save_calibration(self, pathname):
         """Save camera calibration parameters in json file."""
         data = {
+            "model": self._model,
             "camera_matrix": self._camera_matrix.tolist(),
             "dist_coeff": self._dist_coeff.tolist(),
             "mean_error": self._mean_error
@@ -187,13 +375,23 @@ class CameraCalibration():
             json.dump(data, file)
             self._calibration_file = pathname
 
+    def set_calibration(self, camera_matrix, dist_coeff, mean_error=0, model=PINHOLE):
+        """Set camera calibration parameters."""
+        self._model = model
+        self._camera_matrix = camera_matrix
+        self._dist_coeff = dist_coeff
+        self._maps = {}
+        self._mean_error = mean_error
+        self._calibration_file = None
+        self._is_calibrated = True
+
     def load_calibration(self, pathname):
         """Load camera calibration parameters from a file."""
         self._calibration_file = None
         with open(pathname, "r") as file:
             data = json.load(file)
-            self._camera_matrix = np.array(data['camera_matrix'])
-            self._dist_coeff = np.array(data['dist_coeff'])
-            self._mean_error = data['mean_error']
+            self.set_calibration(np.array(data['camera_matrix']),
+                                 np.array(data['dist_coeff']),
+                                 data['mean_error'],
+                                 data.get('model', PINHOLE))
             self._calibration_file = pathname
-            self._is_calibrated = True
@@ -1,11 +1,15 @@
 
 """An application for calibrating video cameras with OpenCV."""
 
+import os
 import wx
 import cv2
 from camera import Camera
-from calibration import CameraCalibration
+from calibration import CameraCalibration, PINHOLE, FISHEYE
 from calibrationpanel import CalibrationPanel
+from framebus import FramePublisher
+from framearchive import FRAMES_EXT, INDEX_EXT
+from event import UI
 
 __author__ = "Jevgenijs Pankovs"
 __license__ = "GNU GPL 3.0 or later"
@@ -28,6 +32,8 @@ class MainWindow(wx.Frame):
         self.menu_load_calibration = None
         self.menu_save_capture = None
         self.menu_save_calibration = None
+        self.menu_fisheye = None
+        self.menu_archive = None
         self.button_capture = None
         self.button_calibrate = None
         self.button_cancel = None
@@ -37,10 +43,16 @@ class MainWindow(wx.Frame):
         self.screen = None
         self.right_panel = None
         self.calibration_panel = None
+        self.frame_bus = None
+        self.frame_bus_enabled = True
         self.calibration = CameraCalibration()
         self.calibration.calibrated += self.on_calibrated
         self.calibration.on_progress += self.on_calibration_progress
 
+        # update UI controls on the UI thread, outside of the frame loop
+        self.calibration.calibrated.dispatch(UI, wx.CallAfter)
+        self.calibration.on_progress.dispatch(UI, wx.CallAfter, coalesce=True)
+
         self.create_layout()
         self.create_menu()
 
@@ -114,6 +126,7 @@ class MainWindow(wx.Frame):
         self.menu_load_calibration = menu1.Append(wx.ID_ANY, "Load calibration file")
         self.menu_save_calibration = menu1.Append(wx.ID_ANY, "Save calibration file")
         self.menu_save_capture = menu1.Append(wx.ID_ANY, "Save captured image")
+        self.menu_archive = menu1.AppendCheckItem(wx.ID_ANY, "Archive calibration frames")
         menu1.AppendSeparator()
         menu_exit = menu1.Append(wx.ID_EXIT, "E&xit")
 
@@ -128,6 +141,8 @@ class MainWindow(wx.Frame):
             self.Bind(wx.EVT_MENU, self.on_camera, menu_item)
 
         menu2.Check(self.camera_menu_ids[0], True)
+        menu2.AppendSeparator()
+        self.menu_fisheye = menu2.AppendCheckItem(wx.ID_ANY, "Fisheye lens")
 
         menu_bar = wx.MenuBar()
         menu_bar.Append(menu1, "&File")
@@ -138,6 +153,7 @@ class MainWindow(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_load_calibration, self.menu_load_calibration)
         self.Bind(wx.EVT_MENU, self.on_save_calibration, self.menu_save_calibration)
         self.Bind(wx.EVT_MENU, self.on_save_capture, self.menu_save_capture)
+        self.Bind(wx.EVT_MENU, self.on_archive_frames, self.menu_archive)
         self.Bind(wx.EVT_MENU, self.on_exit, menu_exit)
 
     def capture_video(self, device=0, fps=30, size=(640, 480)):
@@ -179,7 +195,9 @@ class MainWindow(wx.Frame):
         self.chk_undistort.Disable()
         self.button_calibrate.Disable()
         self.button_cancel.Enable()
-        self.calibration.start_calibration()
+        self.calibration.start_calibration(
+            FISHEYE if self.menu_fisheye.IsChecked() else PINHOLE)
+        self.menu_fisheye.Enable(False)
         self.menu_load_calibration.Enable(False)
         self.menu_save_calibration.Enable(False)
         self.calibration_panel.filename = ""
@@ -190,6 +208,7 @@ class MainWindow(wx.Frame):
         self.button_calibrate.Enable()
         self.button_cancel.Disable()
         self.calibration.cancel_calibration()
+        self.menu_fisheye.Enable(True)
         self.calibration_panel.status = "no"
         self.calibration_panel.error = ""
         self.menu_load_calibration.Enable(True)
@@ -210,6 +229,7 @@ class MainWindow(wx.Frame):
         self.chk_undistort.Enabled = calibrated
         self.menu_load_calibration.Enable(True)
         self.menu_save_calibration.Enable(calibrated)
+        self.menu_fisheye.Enable(True)
 
     def on_calibration_progress(self, progress):
         """Update calibration progress."""
@@ -227,6 +247,7 @@ class MainWindow(wx.Frame):
 
             if self.calibration.can_undistort and self.undistort:
                 frame = self.calibration.undistort(frame)
+                self.publish_frame(frame)
 
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
@@ -238,6 +259,23 @@ class MainWindow(wx.Frame):
 
             self.Refresh(eraseBackground=False)
 
+    def publish_frame(self, frame):
+        """Hand an undistorted frame to other local processes."""
+        if self.frame_bus is not None and self.frame_bus.shape != frame.shape:
+            self.frame_bus.close()
+            self.frame_bus = None
+        if self.frame_bus is None:
+            if not self.frame_bus_enabled:
+                return
+            try:
+                self.frame_bus = FramePublisher(frame.shape)
+            except FileExistsError as error:
+                # another running instance is already publishing frames
+                self.frame_bus_enabled = False
+                wx.LogWarning(f"Undistorted frames are not published: {error}")
+                return
+        self.frame_bus.publish(frame)
+
     def on_paint(self, event):
         """Draw an image captured by the camera on the self.screen panel."""
         # pylint: disable=W0613
@@ -271,6 +309,29 @@ class MainWindow(wx.Frame):
             except IOError:
                 wx.LogError(f"Cannot save captured image in file '{pathname}'.")
 
+    def on_archive_frames(self, event):
+        """Select an archive for the frames recorded during calibration."""
+        # pylint: disable=W0613
+        self.calibration.archive_path = None
+        if not self.menu_archive.IsChecked():
+            return
+
+        with wx.FileDialog(self, "Archive calibration frames",
+                           wildcard="Frame archives (*.frames)|*.frames",
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as file_dialog:
+
+            if file_dialog.ShowModal() == wx.ID_CANCEL:
+                self.menu_archive.Check(False)
+                return
+
+            pathname = os.path.splitext(file_dialog.GetPath())[0]
+
+        # the user agreed to replace an existing archive
+        for ext in (FRAMES_EXT, INDEX_EXT):
+            if os.path.exists(pathname + ext):
+                os.remove(pathname + ext)
+        self.calibration.archive_path = pathname
+
     def on_load_calibration(self, event):
         """Load calibration parameters from a file."""
         # pylint: disable=W0613
@@ -283,6 +344,7 @@ class MainWindow(wx.Frame):
             pathname = file_dialog.GetPath()
             try:
                 self.calibration.load_calibration(pathname)
+                self.menu_fisheye.Check(self.calibration.model == FISHEYE)
                 self.calibration_panel.status = "yes"
                 self.calibration_panel.filename = pathname
                 self.calibration_panel.error = "{:.3f}".format(self.calibration.mean_error)
@@ -312,6 +374,8 @@ class MainWindow(wx.Frame):
         # pylint: disable=W0613
         self.timer.Stop()
         self.camera.release()
+        if self.frame_bus is not None:
+            self.frame_bus.close()
         self.Close(True)
 
 
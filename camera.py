@@ -54,6 +54,46 @@ class Camera():
         """
         return self.capture.read()
 
+    def grab(self):
+        """Grabs the next frame from the camera without decoding it.
+
+        Returns:
+            True if success.
+        """
+        return self.capture.grab()
+
+    def retrieve(self):
+        """Decodes the last grabbed frame.
+
+        Returns:
+            retval, image: True if success; video image frame.
+        """
+        return self.capture.retrieve()
+
     def release(self):
         """Closes video file or capturing device."""
         self.capture.release()
+
+
+def read_synchronized(cameras):
+    """Reads time-synchronized frames from several cameras.
+
+    All cameras grab their frames first, so the frames are taken as close in
+    time as possible, and the slower decoding is done afterwards.
+
+    Args:
+        cameras (list): Camera instances.
+    Returns:
+        retval, images: True if all cameras succeeded; list of video image frames.
+    """
+    grabbed = [camera.grab() for camera in cameras]
+    if not all(grabbed):
+        return False, None
+
+    frames = []
+    for camera in cameras:
+        success, frame = camera.retrieve()
+        if not success:
+            return False, None
+        frames.append(frame)
+    return True, frames
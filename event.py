@@ -1,30 +1,147 @@
 """A simple Event system.
     Source: http://www.valuedlessons.com/2008/04/events-in-python.html
+
+Handlers are called in the order they were added. By default an event calls
+its handlers synchronously on the thread firing it. An event can instead be
+dispatched on an executor (QUEUED) or marshalled to the UI thread (UI), e.g.:
+
+    event.dispatch(QUEUED, executor)
+    event.dispatch(UI, wx.CallAfter, coalesce=True)
+
+Deferred calls of an event are delivered one at a time in the order they were
+fired. A coalescing event delivers only the latest of the calls that are still
+waiting, so a burst of high-rate events such as progress updates results in a
+single handler call.
 """
 
+import collections
+import functools
+import logging
+import threading
+
+SYNC = "sync"
+QUEUED = "queued"
+UI = "ui"
+
+_logger = logging.getLogger(__name__)
+
+
+def _report_error(future):
+    """Log an exception raised by event handlers called on an executor."""
+    if not future.cancelled() and future.exception() is not None:
+        _logger.error("Event handler failed.", exc_info=future.exception())
+
+
+def _submit_queued(executor, function):
+    """Call a function on an executor, reporting its exceptions."""
+    executor.submit(function).add_done_callback(_report_error)
+
+
 class Event:
     """An Event controller class."""
     def __init__(self):
-        self.handlers = set()
+        self.handlers = []
+        self._mode = SYNC
+        self._submit = None
+        self._coalesce = False
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._scheduled = False
+
+    @property
+    def mode(self):
+        """Dispatch mode: SYNC, QUEUED or UI."""
+        return self._mode
+
+    def dispatch(self, mode, target=None, coalesce=False):
+        """Set how event handlers are called.
+
+        Args:
+            mode (str): SYNC calls handlers on the firing thread, QUEUED submits
+            them to an executor, UI passes them to a function running callables
+            on the UI thread.
+            target: Executor for QUEUED, e.g. ThreadPoolExecutor; function for UI,
+            e.g. wx.CallAfter. Ignored for SYNC.
+            coalesce (bool): Deliver only the latest of the waiting calls.
+        """
+        if mode not in (SYNC, QUEUED, UI):
+            raise ValueError(f"Unknown dispatch mode '{mode}'.")
+        if mode != SYNC and target is None:
+            raise ValueError(f"Dispatch mode '{mode}' requires a target.")
+
+        if mode == SYNC:
+            submit = None
+        elif mode == QUEUED:
+            submit = functools.partial(_submit_queued, target)
+        else:
+            submit = target
+
+        with self._lock:
+            self._mode = mode
+            self._submit = submit
+            self._coalesce = coalesce
+        return self
 
     def handle(self, handler):
         """Add event handler."""
-        self.handlers.add(handler)
+        with self._lock:
+            if handler not in self.handlers:
+                self.handlers = self.handlers + [handler]
         return self
 
     def unhandle(self, handler):
         """Remove event handler."""
-        try:
-            self.handlers.remove(handler)
-        except:
-            raise ValueError("Handler is not handling this event, so cannot unhandle it.")
+        with self._lock:
+            try:
+                handlers = list(self.handlers)
+                handlers.remove(handler)
+                self.handlers = handlers
+            except:
+                raise ValueError("Handler is not handling this event, so cannot unhandle it.")
         return self
 
     def fire(self, *args, **kargs):
         """Call event handler."""
+        with self._lock:
+            submit = self._submit
+            if submit is not None:
+                if self._coalesce:
+                    self._pending.clear()
+                self._pending.append((args, kargs))
+                if self._scheduled:
+                    return
+                self._scheduled = True
+
+        if submit is None:
+            self._call(args, kargs)
+        else:
+            submit(self._drain)
+
+    def _call(self, args, kargs):
+        # the handler list is replaced rather than modified,
+        # so it can be iterated while other threads add or remove handlers
         for handler in self.handlers:
             handler(*args, **kargs)
 
+    def _drain(self):
+        """Deliver deferred calls in the order they were fired."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._scheduled = False
+                    return
+                args, kargs = self._pending.popleft()
+            try:
+                self._call(args, kargs)
+            except:
+                # let the remaining calls be delivered by a new dispatch
+                with self._lock:
+                    submit = self._submit if self._pending else None
+                    self._scheduled = submit is not None
+                if submit is not None:
+                    submit(self._drain)
+                raise
+
     def get_handler_count(self):
         """Get event handlers count."""
         return len(self.handlers)
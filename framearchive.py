@@ -0,0 +1,173 @@
+"""A compact append-only archive of raw grayscale frames.
+
+An archive is a pair of files: "<name>.frames" holds raw 8-bit grayscale frames
+written one after another, "<name>.index" holds a fixed-size record for every
+frame with its offset, size, timestamp, recording session and a flag telling if
+the chessboard was detected in it. Every writer opened on an archive starts a
+new session, and an archive is replayed one session at a time, by default the
+latest one. A record is appended only after its frame data, so an archive
+left by an interrupted recording stays readable; a partly written record or
+frame is dropped when the archive is opened for appending again.
+
+Archives are replayed through a memory map of the frame file, so frames are
+read as NumPy views at disk speed without decoding.
+"""
+
+import mmap
+import os
+import time
+import numpy as np
+
+FRAMES_EXT = ".frames"
+INDEX_EXT = ".index"
+
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("height", "<u4"), ("width", "<u4"),
+                        ("timestamp", "<f8"), ("session", "<u4"), ("detected", "u1")])
+
+
+class FrameArchiveWriter():
+    """This class appends frames to an archive."""
+
+    def __init__(self, pathname):
+        """Open an archive for appending a new session, creating the archive
+        if it does not exist.
+
+        Args:
+            pathname (str): Archive path without extension.
+        """
+        self.pathname = pathname
+        self.frame_count, self._offset, last_session = self._recover(pathname)
+        self.session = last_session + 1
+        self._frames = open(pathname + FRAMES_EXT, "ab")
+        self._index = open(pathname + INDEX_EXT, "ab")
+
+    @staticmethod
+    def _recover(pathname):
+        """Truncate data left by an interrupted recording after the last complete frame.
+
+        Returns:
+            count, end, session: Number of complete frames; size of their data;
+            session of the last frame, or 0 if there are no frames.
+        """
+        with open(pathname + INDEX_EXT, "a+b") as index, \
+                open(pathname + FRAMES_EXT, "a+b") as frames:
+            frames_size = os.fstat(frames.fileno()).st_size
+            count = os.fstat(index.fileno()).st_size // INDEX_DTYPE.itemsize
+            end = 0
+            session = 0
+            while count > 0:
+                index.seek((count - 1) * INDEX_DTYPE.itemsize)
+                record = np.frombuffer(index.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)[0]
+                end = int(record["offset"]) + int(record["height"]) * int(record["width"])
+                if end <= frames_size:
+                    session = int(record["session"])
+                    break
+                # the record was written, but its frame data was not
+                count -= 1
+                end = 0
+
+            index.truncate(count * INDEX_DTYPE.itemsize)
+            frames.truncate(end)
+        return count, end, session
+
+    def append(self, frame, detected=False, timestamp=None):
+        """Append a grayscale frame.
+
+        Args:
+            frame (image): 8-bit single-channel image.
+            detected (bool): True if the chessboard was detected in the frame.
+            timestamp (float): Frame time in seconds since the epoch. Default is now.
+        """
+        if frame.ndim != 2 or frame.dtype != np.uint8:
+            raise ValueError("Only 8-bit grayscale frames can be archived.")
+
+        height, width = frame.shape
+        record = np.array([(self._offset, height, width,
+                            time.time() if timestamp is None else timestamp,
+                            self.session, detected)], dtype=INDEX_DTYPE)
+        self._frames.write(np.ascontiguousarray(frame).tobytes())
+        self._frames.flush()
+        self._index.write(record.tobytes())
+        self._offset += frame.nbytes
+        self.frame_count += 1
+
+    def close(self):
+        """Flush and close the archive files."""
+        self._frames.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameArchive():
+    """This class replays frames from an archive."""
+
+    def __init__(self, pathname, session=None):
+        """Open a session of an archive for reading.
+
+        Args:
+            pathname (str): Archive path without extension.
+            session (int): Recording session. Default is the latest session.
+        """
+        self.pathname = pathname
+        self.index = np.fromfile(pathname + INDEX_EXT, dtype=INDEX_DTYPE)
+        self._mmap = None
+        self._data = np.zeros(0, dtype=np.uint8)
+
+        with open(pathname + FRAMES_EXT, "rb") as file:
+            if os.fstat(file.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(self._mmap, "madvise"):
+                    self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+                self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        # skip records written after the last complete frame
+        end = self.index["offset"] + self.index["height"].astype(np.uint64) * self.index["width"]
+        self.index = self.index[end <= len(self._data)]
+
+        self.sessions = [int(x) for x in np.unique(self.index["session"])]
+        if session is None and self.sessions:
+            session = self.sessions[-1]
+        self.session = session
+        self.index = self.index[self.index["session"] == session]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """Get a frame as a read-only view of the archive."""
+        record = self.index[i]
+        offset, height, width = int(record["offset"]), int(record["height"]), int(record["width"])
+        return self._data[offset:offset + height * width].reshape(height, width)
+
+    def __iter__(self):
+        for i in range(len(self.index)):
+            yield self[i]
+
+    def detected(self):
+        """Indices of the session frames in which the chessboard was detected."""
+        return np.flatnonzero(self.index["detected"])
+
+    def close(self):
+        """Close the archive.
+
+        If frames read from the archive are still referenced, the memory map is
+        released when the last of them is garbage collected.
+        """
+        self._data = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
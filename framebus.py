@@ -0,0 +1,312 @@
+"""A shared-memory frame bus for handing frames to other local processes.
+
+The bus is a ring of fixed-size frame slots in a `multiprocessing.shared_memory`
+block. The publisher owns the block and writes frames into consecutive slots,
+stamping every frame with a sequence number. Subscribers attach to the block by
+name and read frames as NumPy views of the shared buffer, without copying and
+without locks. A subscriber that falls more than one ring behind the publisher
+detects the overrun from the sequence numbers.
+
+When the publisher closes the bus, or a new publisher replaces a bus left by
+a process that did not exit cleanly, the bus is marked closed and subscribers
+get FrameBusClosed from read().
+
+Memory layout:
+    header: magic, slot count, height, width, channels, last written sequence,
+            publisher process id, closed flag
+    slots:  slot sequence number followed by the frame bytes padded to 8 bytes,
+            one per slot
+"""
+
+import os
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+FRAME_BUS_NAME = "calibrationlab_frames"
+FRAME_BUS_SLOTS = 8
+
+_MAGIC = 0x43414c4246524d53
+_HEADER_FIELDS = 8
+_HEADER_SIZE = _HEADER_FIELDS * 8
+_SLOT_HEADER_SIZE = 8
+_SEQ = 5
+_PID = 6
+_CLOSED = 7
+
+# names of the frame buses published by this process
+_published = set()
+
+
+def _attach(name):
+    """Attach to an existing shared memory block without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 every attached block is registered with the resource
+        # tracker, which would destroy it when the subscriber process exits
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _published:
+            # a block published by this process is tracked as a single entry,
+            # which must stay registered for the publisher
+            resource_tracker.unregister(shm._name, "shared_memory")  # pylint: disable=W0212
+        return shm
+
+
+def _process_alive(pid):
+    """Check if a process is running."""
+    if os.name == "nt":
+        # os.kill() cannot probe a process on Windows; there a shared memory
+        # block exists only while some process has it open, so assume it is used
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _slot_size(height, width, channels):
+    """Size of a slot, padded so that every slot sequence number is 8-byte aligned
+    and can be written and read atomically."""
+    return _SLOT_HEADER_SIZE + (height * width * channels + 7) // 8 * 8
+
+
+def _frame_shape(shape):
+    """Normalize a frame shape to (height, width, channels)."""
+    if len(shape) == 2:
+        return (shape[0], shape[1], 1)
+    return tuple(shape)
+
+
+class FrameBusOverrun(Exception):
+    """Raised when a subscriber has been overtaken by the publisher."""
+
+    def __init__(self, expected, latest):
+        super().__init__("Frame bus overrun: expected frame %d, latest is %d"
+                         % (expected, latest))
+        self.expected = expected
+        self.latest = latest
+
+    @property
+    def dropped(self):
+        """Number of frames lost by the subscriber."""
+        return self.latest - self.expected
+
+
+class FrameBusClosed(Exception):
+    """Raised when the publisher has closed the frame bus."""
+
+
+class _FrameBus():
+    """Common shared memory mapping used by the publisher and the subscriber."""
+
+    def __init__(self, shm):
+        self._shm = shm
+        self._header = np.ndarray((_HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)
+        if int(self._header[0]) not in (0, _MAGIC):
+            raise ValueError(f"Shared memory block '{shm.name}' is not a frame bus.")
+
+    def _map_slots(self):
+        slots, height, width, channels = (int(x) for x in self._header[1:5])
+        self.shape = (height, width) if channels == 1 else (height, width, channels)
+        self.slots = slots
+        self._slot_size = _slot_size(height, width, channels)
+        self._slot_seq = []
+        self._slot_frame = []
+        for i in range(slots):
+            offset = _HEADER_SIZE + i * self._slot_size
+            self._slot_seq.append(np.ndarray((1,), dtype=np.uint64,
+                                             buffer=self._shm.buf, offset=offset))
+            self._slot_frame.append(np.ndarray(self.shape, dtype=np.uint8, buffer=self._shm.buf,
+                                               offset=offset + _SLOT_HEADER_SIZE))
+
+    @property
+    def name(self):
+        """Shared memory block name."""
+        return self._shm.name
+
+    @property
+    def sequence(self):
+        """Sequence number of the last published frame, 0 if none."""
+        return int(self._header[_SEQ])
+
+    @property
+    def closed(self):
+        """True if the publisher has closed the frame bus."""
+        return bool(self._header[_CLOSED])
+
+    def _release(self):
+        # views must be dropped before the shared memory can be closed
+        self._slot_seq = []
+        self._slot_frame = []
+        self._header = None
+        self._shm.close()
+
+
+class FramePublisher(_FrameBus):
+    """This class writes frames into a shared memory ring."""
+
+    def __init__(self, shape, name=FRAME_BUS_NAME, slots=FRAME_BUS_SLOTS):
+        """Create the frame bus.
+
+        Args:
+            shape ((height, width[, channels])): Shape of the 8-bit frames to publish.
+            name (str): Shared memory block name.
+            slots (int): Number of frames kept in the ring.
+        """
+        height, width, channels = _frame_shape(shape)
+        size = _HEADER_SIZE + slots * _slot_size(height, width, channels)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self._close_stale(name)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        _published.add(name)
+        super().__init__(shm)
+        self._header[1:_SEQ] = (slots, height, width, channels)
+        self._header[_SEQ] = 0
+        self._header[_PID] = os.getpid()
+        self._header[_CLOSED] = 0
+        self._map_slots()
+        self._header[0] = _MAGIC
+
+    @staticmethod
+    def _close_stale(name):
+        """Remove a frame bus left by a process that did not exit cleanly.
+
+        Only a frame bus that was closed or whose publisher process is gone is
+        removed; any other shared memory block with the name is left untouched.
+
+        Raises:
+            FileExistsError: The block is used by a running publisher or is not a frame bus.
+        """
+        stale = _attach(name)
+        try:
+            if stale.size < _HEADER_SIZE:
+                raise FileExistsError(f"Shared memory block '{name}' is not a frame bus.")
+            header = np.ndarray((_HEADER_FIELDS,), dtype=np.uint64, buffer=stale.buf)
+            magic, pid, closed = int(header[0]), int(header[_PID]), bool(header[_CLOSED])
+            if magic != _MAGIC:
+                raise FileExistsError(f"Shared memory block '{name}' is not a frame bus.")
+            if not closed:
+                if _process_alive(pid):
+                    raise FileExistsError(
+                        f"Frame bus '{name}' is used by a running process {pid}.")
+                # let subscribers still mapped to the stale block know it is gone
+                header[_CLOSED] = 1
+        finally:
+            header = None
+            stale.close()
+
+        # unlink through a tracked handle, so the resource tracker stays consistent
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+
+    def publish(self, frame):
+        """Write a frame into the next slot of the ring.
+
+        Args:
+            frame (image): 8-bit unsigned image of the bus shape.
+        Returns:
+            sequence number of the published frame.
+        """
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the bus shape {self.shape}.")
+
+        seq = self.sequence + 1
+        slot = seq % self.slots
+
+        # the slot sequence is cleared while the frame is being written,
+        # so a subscriber never takes a half written frame for a complete one
+        self._slot_seq[slot][0] = 0
+        np.copyto(self._slot_frame[slot], frame)
+        self._slot_seq[slot][0] = seq
+        self._header[_SEQ] = seq
+        return seq
+
+    def close(self):
+        """Close and destroy the shared memory block."""
+        self._header[_CLOSED] = 1
+        shm = self._shm
+        self._release()
+        shm.unlink()
+        _published.discard(shm.name)
+
+
+class FrameSubscriber(_FrameBus):
+    """This class reads frames published into a shared memory ring."""
+
+    def __init__(self, name=FRAME_BUS_NAME):
+        """Attach to an existing frame bus.
+
+        Args:
+            name (str): Shared memory block name.
+        """
+        super().__init__(_attach(name))
+        if int(self._header[0]) != _MAGIC:
+            self._release()
+            raise ValueError(f"Frame bus '{name}' is not initialized.")
+        self._map_slots()
+        self._next = self.sequence + 1
+
+    def is_valid(self, seq):
+        """Check if a frame returned by read() has not been overwritten yet.
+
+        Views returned by read() point into the ring, so a consumer should
+        call this after it has finished with a view to make sure the data
+        it processed was not replaced by the publisher in the meantime.
+        """
+        return int(self._slot_seq[seq % self.slots][0]) == seq
+
+    def read(self, copy=False):
+        """Read the next frame.
+
+        Args:
+            copy (bool): Return a copy of the frame instead of a view of the ring.
+        Returns:
+            seq, frame: Sequence number and frame; (0, None) if there is no new frame.
+        Raises:
+            FrameBusOverrun: The next frame was overwritten before it was read.
+            The subscriber resynchronizes to the latest frame.
+            FrameBusClosed: The publisher has closed the frame bus.
+        """
+        if self.closed:
+            raise FrameBusClosed(f"Frame bus '{self.name}' is closed.")
+
+        latest = self.sequence
+        if latest < self._next:
+            return 0, None
+
+        seq = self._next
+        if latest - seq >= self.slots:
+            self._next = latest
+            raise FrameBusOverrun(seq, latest)
+
+        frame = self._slot_frame[seq % self.slots]
+        if copy:
+            frame = frame.copy()
+        if not self.is_valid(seq):
+            self._next = self.sequence
+            raise FrameBusOverrun(seq, self._next)
+
+        self._next = seq + 1
+        return seq, frame
+
+    def read_latest(self, copy=False):
+        """Skip to the most recent frame and read it.
+
+        Returns:
+            seq, frame: Sequence number and frame; (0, None) if there is no new frame.
+        """
+        latest = self.sequence
+        if latest >= self._next:
+            self._next = latest
+        return self.read(copy)
+
+    def close(self):
+        """Detach from the shared memory block."""
+        self._release()
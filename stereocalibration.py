@@ -0,0 +1,273 @@
+"""A module for stereo and multi-camera extrinsic calibration using a chessboard.
+
+Every camera of the rig must be calibrated with CameraCalibration first. The
+extrinsics solve keeps these intrinsics fixed and finds the pose of every camera
+relative to the first (reference) camera from frames in which the chessboard is
+seen by all cameras at the same time.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from event import Event
+from calibration import MIN_CALIBRATION_FRAMES, PINHOLE
+
+class StereoCalibration():
+    """This class performs extrinsic calibration of two or more cameras."""
+
+    def __init__(self, calibrations):
+        """Create stereo calibration.
+
+        Args:
+            calibrations (list): CameraCalibration instances with intrinsics of
+            every camera. The first camera is the reference one.
+        """
+        if len(calibrations) < 2:
+            raise ValueError("Stereo calibration requires at least two cameras.")
+
+        self.calibrations = list(calibrations)
+        self.record_min_num_frames = MIN_CALIBRATION_FRAMES
+        self.record_cnt = 0
+        self._recording = False
+        self._is_calibrated = False
+        self._image_size = None
+        self._extrinsics = []
+        self._calibration_file = None
+        self._maps = {}
+        self._executor = ThreadPoolExecutor(max_workers=len(self.calibrations))
+
+        # events
+        self.calibrated = Event()
+        self.on_progress = Event()
+
+        # object points and image points of every camera from all the frame sets
+        self.obj_points = []
+        self.img_points = [[] for _ in self.calibrations]
+
+    @property
+    def camera_count(self):
+        """Number of cameras."""
+        return len(self.calibrations)
+
+    @property
+    def is_calibrated(self):
+        """True if calibrated, False otherwise."""
+        return self._is_calibrated
+
+    @property
+    def is_calibrating(self):
+        """Flag is True if calibration is in progress."""
+        return self._recording
+
+    @property
+    def can_rectify(self):
+        """Flag is True if frames can be rectified using calibration parameters."""
+        return self.is_calibrated and not self._recording
+
+    @property
+    def calibration_file(self):
+        """Calibration file."""
+        return self._calibration_file
+
+    @property
+    def extrinsics(self):
+        """Pose of every camera relative to the reference camera, a list of
+        dictionaries with rotation matrix "R", translation vector "T", essential
+        matrix "E", fundamental matrix "F" and re-projection error "rms"."""
+        return self._extrinsics
+
+    def reset_recording(self):
+        """Disable recording mode and reset data structures."""
+        self.record_cnt = 0
+        self.obj_points = []
+        self.img_points = [[] for _ in self.calibrations]
+
+    def start_calibration(self):
+        """Start extrinsic calibration process."""
+        if not all(calibration.is_calibrated for calibration in self.calibrations):
+            raise ValueError("Every camera must be calibrated before stereo calibration.")
+        if any(calibration.model != PINHOLE for calibration in self.calibrations):
+            raise ValueError("Stereo calibration supports the pinhole camera model only.")
+
+        self.reset_recording()
+        self._recording = True
+        self._is_calibrated = False
+        self._calibration_file = None
+
+    def cancel_calibration(self):
+        """Cancel extrinsic calibration process."""
+        self._recording = False
+        self._is_calibrated = False
+        self.reset_recording()
+
+    def calibrate(self, frames):
+        """Processes each set of synchronized frames.
+
+        Args:
+            frames (list): input BGR images, one per camera, taken at the same time,
+            e.g. by camera.read_synchronized().
+        """
+        if not self._recording:
+            return
+
+        if len(frames) != self.camera_count:
+            raise ValueError(f"Expected {self.camera_count} frames, got {len(frames)}.")
+
+        if self.record_cnt < self.record_min_num_frames:
+
+            # detect the chessboard in all views in parallel
+            corners = list(self._executor.map(
+                lambda args: args[0].find_corners(args[1]), zip(self.calibrations, frames)))
+
+            # only frame sets where every camera sees the chessboard can be used
+            if all(c is not None for c in corners):
+                for i, (frame, view_corners) in enumerate(zip(frames, corners)):
+                    cv2.drawChessboardCorners(frame, self.calibrations[i].chessboard_size,
+                                              view_corners, True)
+                    self.img_points[i].append(view_corners)
+
+                self.obj_points.append(self.calibrations[0].objp)
+                self.record_cnt += 1
+
+                # report progress
+                message = "%d of %d frames" % (self.record_cnt, self.record_min_num_frames)
+                self.on_progress(message)
+        else:
+            self._recording = False
+            image_height, image_width = frames[0].shape[:2]
+            self._image_size = (image_width, image_height)
+            try:
+                self._solve()
+                self._is_calibrated = True
+            except cv2.error:
+                # the solver fails on degenerate chessboard views,
+                # the calibrated event reports the rig as not calibrated
+                self._is_calibrated = False
+
+            self.reset_recording()
+            self.calibrated()
+
+    def _solve(self):
+        """Solve extrinsics of every camera relative to the reference camera."""
+        reference = self.calibrations[0]
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-5)
+
+        self._extrinsics = [{"R": np.eye(3), "T": np.zeros((3, 1)),
+                             "E": np.zeros((3, 3)), "F": np.zeros((3, 3)), "rms": 0.0}]
+        for i in range(1, self.camera_count):
+            calibration = self.calibrations[i]
+            rms, _, _, _, _, rotation, translation, essential, fundamental = cv2.stereoCalibrate(
+                self.obj_points, self.img_points[0], self.img_points[i],
+                reference.camera_matrix, reference.dist_coeff,
+                calibration.camera_matrix, calibration.dist_coeff,
+                self._image_size, criteria=criteria, flags=cv2.CALIB_FIX_INTRINSIC)
+            self._extrinsics.append({"R": rotation, "T": translation,
+                                     "E": essential, "F": fundamental, "rms": rms})
+        self._maps = {}
+
+    def _rectify_maps(self, view, size):
+        """Get rectification maps of the reference camera and the camera of the view
+        for the frame size, computing them on first use."""
+        if tuple(size) != tuple(self._image_size):
+            # the solved intrinsics and extrinsics are valid for the calibration size only
+            raise ValueError(f"Frame size {tuple(size)} differs from the calibration "
+                             f"frame size {tuple(self._image_size)}.")
+
+        maps = self._maps.get((view, size))
+        if maps is None:
+            reference = self.calibrations[0]
+            calibration = self.calibrations[view]
+            extrinsics = self._extrinsics[view]
+            rect1, rect2, proj1, proj2, disparity, _, _ = cv2.stereoRectify(
+                reference.camera_matrix, reference.dist_coeff,
+                calibration.camera_matrix, calibration.dist_coeff,
+                size, extrinsics["R"], extrinsics["T"], alpha=0)
+            maps = (cv2.initUndistortRectifyMap(reference.camera_matrix, reference.dist_coeff,
+                                                rect1, proj1, size, cv2.CV_16SC2),
+                    cv2.initUndistortRectifyMap(calibration.camera_matrix, calibration.dist_coeff,
+                                                rect2, proj2, size, cv2.CV_16SC2),
+                    disparity)
+            self._maps[(view, size)] = maps
+        return maps
+
+    def disparity_to_depth(self, view=1):
+        """Disparity-to-depth mapping matrix Q of the rectified pair.
+
+        Args:
+            view (int): Camera paired with the reference camera.
+        Returns:
+            4x4 matrix, or None if not calibrated.
+        """
+        if not self._is_calibrated:
+            return None
+
+        return self._rectify_maps(view, self._image_size)[2]
+
+    def rectify(self, reference_frame, frame, view=1):
+        """Rectify a pair of synchronized frames.
+
+        Args:
+            reference_frame (image): frame of the reference camera.
+            frame (image): frame of the camera paired with the reference camera.
+            view (int): Camera paired with the reference camera. Default is 1.
+        Returns:
+            rectified frames of the reference camera and of the paired camera.
+        Raises:
+            ValueError: The frames are not of the calibration frame size.
+        """
+        if not self._is_calibrated:
+            return reference_frame, frame
+
+        height, width = reference_frame.shape[:2]
+        reference_maps, maps, _ = self._rectify_maps(view, (width, height))
+        return (cv2.remap(reference_frame, reference_maps[0], reference_maps[1], cv2.INTER_LINEAR),
+                cv2.remap(frame, maps[0], maps[1], cv2.INTER_LINEAR))
+
+    def close(self):
+        """Shut down the chessboard detection workers."""
+        self._executor.shutdown()
+
+    def save_calibration(self, pathname):
+        """Save stereo calibration parameters in json file."""
+        data = {
+            "image_size": list(self._image_size),
+            "cameras": [{
+                "camera_matrix": calibration.camera_matrix.tolist(),
+                "dist_coeff": calibration.dist_coeff.tolist(),
+                "mean_error": calibration.mean_error,
+                "R": extrinsics["R"].tolist(),
+                "T": extrinsics["T"].tolist(),
+                "E": extrinsics["E"].tolist(),
+                "F": extrinsics["F"].tolist(),
+                "rms": extrinsics["rms"]
+                } for calibration, extrinsics in zip(self.calibrations, self._extrinsics)]
+            }
+        with open(pathname, "w") as file:
+            json.dump(data, file)
+            self._calibration_file = pathname
+
+    def load_calibration(self, pathname):
+        """Load stereo calibration parameters from a file.
+
+        Intrinsics of the cameras are replaced by the ones stored in the file.
+        """
+        self._calibration_file = None
+        with open(pathname, "r") as file:
+            data = json.load(file)
+            cameras = data["cameras"]
+            if len(cameras) != self.camera_count:
+                raise ValueError(f"Calibration file has {len(cameras)} cameras, "
+                                 f"expected {self.camera_count}.")
+
+            self._image_size = tuple(data["image_size"])
+            self._extrinsics = []
+            for calibration, camera in zip(self.calibrations, cameras):
+                calibration.set_calibration(np.array(camera["camera_matrix"]),
+                                            np.array(camera["dist_coeff"]),
+                                            camera["mean_error"])
+                self._extrinsics.append({key: np.array(camera[key]) for key in "RTEF"})
+                self._extrinsics[-1]["rms"] = camera["rms"]
+            self._maps = {}
+            self._calibration_file = pathname
+            self._is_calibrated = True
@@ -0,0 +1,75 @@
+"""Tests of the camera calibration."""
+
+import json
+import os
+import numpy as np
+import cv2
+from calibration import CameraCalibration, PINHOLE, FISHEYE
+
+LEGACY_PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera.json")
+CAMERA_MATRIX = np.array([[300.0, 0.0, 320.0], [0.0, 300.0, 240.0], [0.0, 0.0, 1.0]])
+FISHEYE_COEFF = np.array([[0.1], [-0.05], [0.01], [0.0]])
+FRAME = np.zeros((480, 640, 3), dtype=np.uint8)
+
+
+def fisheye_calibration():
+    """Calibrate a fisheye camera from synthetic chessboard views."""
+    calibration = CameraCalibration()
+    calibration.record_min_num_frames = 20
+    calibration.start_calibration(FISHEYE)
+    points = calibration.objp.reshape(1, -1, 3).astype(np.float64)
+    rng = np.random.default_rng(1)
+    for _ in range(calibration.record_min_num_frames):
+        rvec = rng.normal(0, 0.3, 3)
+        tvec = np.array([-4 + rng.normal(), -3 + rng.normal(), 12 + 2 * rng.normal()])
+        corners, _ = cv2.fisheye.projectPoints(points, rvec, tvec, CAMERA_MATRIX, FISHEYE_COEFF)
+        calibration.obj_points.append(calibration.objp)
+        calibration.img_points.append(corners.reshape(-1, 1, 2).astype(np.float32))
+        calibration.record_cnt += 1
+
+    calibration.calibrate(FRAME.copy())
+    return calibration
+
+
+def test_fisheye_solve():
+    calibration = fisheye_calibration()
+    assert calibration.is_calibrated
+    assert calibration.model == FISHEYE
+    assert np.allclose(calibration.camera_matrix, CAMERA_MATRIX, atol=0.5)
+    assert np.allclose(calibration.dist_coeff.ravel(), FISHEYE_COEFF.ravel(), atol=1e-3)
+    assert calibration.mean_error < 0.01
+
+
+def test_fisheye_output_size_and_map_cache():
+    calibration = fisheye_calibration()
+    assert calibration.undistort(FRAME).shape == FRAME.shape
+
+    calibration.output_size = (1280, 960)
+    assert calibration.undistort(FRAME).shape == (960, 1280, 3)
+
+    for fov_scale in (1.1, 1.2, 1.3):
+        calibration.fov_scale = fov_scale
+        calibration.undistort(FRAME)
+    assert len(calibration._maps) == 1  # pylint: disable=W0212
+
+
+def test_fisheye_save_and_load(tmp_path):
+    calibration = fisheye_calibration()
+    pathname = str(tmp_path / "fisheye.json")
+    calibration.save_calibration(pathname)
+    with open(pathname) as file:
+        assert json.load(file)["model"] == FISHEYE
+
+    loaded = CameraCalibration()
+    loaded.load_calibration(pathname)
+    assert loaded.model == FISHEYE
+    assert np.allclose(loaded.camera_matrix, calibration.camera_matrix)
+    assert np.array_equal(loaded.undistort(FRAME), calibration.undistort(FRAME))
+
+
+def test_legacy_file_loads_as_pinhole():
+    calibration = CameraCalibration()
+    calibration.load_calibration(LEGACY_PROFILE)
+    assert calibration.is_calibrated
+    assert calibration.model == PINHOLE
+    assert calibration.undistort(FRAME).shape == FRAME.shape
@@ -0,0 +1,138 @@
+"""Tests of the event dispatch."""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from event import Event, SYNC, QUEUED, UI
+
+
+class FakeCallAfter():
+    """A list-backed stand-in for wx.CallAfter."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, function):
+        self.calls.append(function)
+
+    def run(self):
+        """Run the queued calls like the UI event loop does."""
+        while self.calls:
+            self.calls.pop(0)()
+
+
+def test_handlers_called_in_registration_order():
+    event = Event()
+    calls = []
+    handlers = [lambda x, i=i: calls.append((i, x)) for i in range(5)]
+    for handler in handlers:
+        event += handler
+    event += handlers[0]
+    assert len(event) == 5
+
+    event(1)
+    assert calls == [(i, 1) for i in range(5)]
+
+    event -= handlers[2]
+    with pytest.raises(ValueError):
+        event -= handlers[2]
+    assert len(event) == 4
+
+
+def test_ui_dispatch_coalesces_burst():
+    call_after = FakeCallAfter()
+    event = Event().dispatch(UI, call_after, coalesce=True)
+    calls = []
+    event += calls.append
+
+    for i in range(100):
+        event(i)
+    assert not calls
+    assert len(call_after.calls) == 1
+
+    call_after.run()
+    assert calls == [99]
+
+
+def test_ui_dispatch_keeps_firing_order():
+    call_after = FakeCallAfter()
+    event = Event().dispatch(UI, call_after)
+    calls = []
+    event += calls.append
+
+    for i in range(10):
+        event(i)
+    call_after.run()
+    assert calls == list(range(10))
+
+
+def test_queued_dispatch_keeps_firing_order():
+    executor = ThreadPoolExecutor(max_workers=4)
+    event = Event().dispatch(QUEUED, executor)
+    calls = []
+    threads = set()
+
+    def handler(value):
+        time.sleep(0.001)
+        threads.add(threading.get_ident())
+        calls.append(value)
+
+    event += handler
+    for i in range(50):
+        event(i)
+    executor.shutdown()
+    assert calls == list(range(50))
+    assert threading.get_ident() not in threads
+
+
+def test_queued_handler_error_is_logged(caplog):
+    executor = ThreadPoolExecutor(max_workers=1)
+    event = Event().dispatch(QUEUED, executor)
+
+    def handler():
+        raise RuntimeError("handler failed")
+
+    event += handler
+    with caplog.at_level(logging.ERROR, logger="event"):
+        event()
+        executor.shutdown()
+    assert any(record.exc_info and "handler failed" in str(record.exc_info[1])
+               for record in caplog.records)
+
+
+def test_handler_error_does_not_drop_pending_calls():
+    call_after = FakeCallAfter()
+    event = Event().dispatch(UI, call_after)
+    calls = []
+
+    def handler(value):
+        if value == 0:
+            raise RuntimeError("handler failed")
+        calls.append(value)
+
+    event += handler
+    for i in range(3):
+        event(i)
+
+    with pytest.raises(RuntimeError):
+        call_after.calls.pop(0)()
+    call_after.run()
+    assert calls == [1, 2]
+
+    # the event keeps dispatching after the failure
+    event(3)
+    call_after.run()
+    assert calls == [1, 2, 3]
+
+
+def test_dispatch_requires_target():
+    event = Event()
+    with pytest.raises(ValueError):
+        event.dispatch(QUEUED)
+    with pytest.raises(ValueError):
+        event.dispatch(UI)
+    with pytest.raises(ValueError):
+        event.dispatch("unknown")
+    assert event.mode == SYNC
@@ -0,0 +1,90 @@
+"""Tests of the frame archive."""
+
+import numpy as np
+from calibration import CameraCalibration
+from framearchive import FrameArchive, FrameArchiveWriter, INDEX_EXT
+
+
+def make_frames(count, shape=(48, 64)):
+    return [np.full(shape, i, dtype=np.uint8) for i in range(count)]
+
+
+def test_iterate_inside_with_block(tmp_path):
+    pathname = str(tmp_path / "session")
+    frames = make_frames(3)
+    with FrameArchiveWriter(pathname) as writer:
+        for i, frame in enumerate(frames):
+            writer.append(frame, detected=i % 2 == 0)
+
+    with FrameArchive(pathname) as archive:
+        assert len(archive) == 3
+        for frame, expected in zip(archive, frames):
+            assert np.array_equal(frame, expected)
+        assert list(archive.detected()) == [0, 2]
+
+
+def test_append_after_interrupted_record(tmp_path):
+    pathname = str(tmp_path / "session")
+    frames = make_frames(4)
+    with FrameArchiveWriter(pathname) as writer:
+        for frame in frames[:3]:
+            writer.append(frame)
+
+    # a record cut short by an interrupted recording
+    with open(pathname + INDEX_EXT, "ab") as index:
+        index.write(b"\x01" * 7)
+
+    with FrameArchiveWriter(pathname) as writer:
+        assert writer.frame_count == 3
+        writer.append(frames[3])
+
+    with FrameArchive(pathname) as archive:
+        assert archive.sessions == [1, 2]
+        assert len(archive) == 1
+        assert np.array_equal(archive[0], frames[3])
+
+    with FrameArchive(pathname, session=1) as archive:
+        assert len(archive) == 3
+        for frame, expected in zip(archive, frames):
+            assert np.array_equal(frame, expected)
+
+
+def test_calibration_closes_archive(tmp_path):
+    pathname = str(tmp_path / "session")
+    calibration = CameraCalibration()
+    calibration.archive_path = pathname
+    calibration.start_calibration()
+    for frame in make_frames(2, (48, 64, 3)):
+        calibration.calibrate(frame)
+    calibration.cancel_calibration()
+
+    # frames of another calibration do not go to a closed archive
+    calibration.archive_path = None
+    calibration.start_calibration()
+    calibration.calibrate(make_frames(1, (48, 64, 3))[0])
+    calibration.cancel_calibration()
+
+    with FrameArchive(pathname) as archive:
+        assert len(archive) == 2
+        assert len(archive.detected()) == 0
+
+
+def test_calibration_runs_are_separate_sessions(tmp_path):
+    pathname = str(tmp_path / "session")
+    calibration = CameraCalibration()
+    calibration.archive_path = pathname
+    for count in (3, 2):
+        calibration.start_calibration()
+        for frame in make_frames(count, (48, 64, 3)):
+            calibration.calibrate(frame + 10 * count)
+        calibration.cancel_calibration()
+
+    # replay gets the frames of the latest run only
+    with FrameArchive(pathname) as archive:
+        assert archive.sessions == [1, 2]
+        assert len(archive) == 2
+        assert [int(frame[0, 0]) for frame in archive] == [20, 21]
+        assert not calibration.replay(archive)
+
+    with FrameArchive(pathname, session=1) as archive:
+        assert [int(frame[0, 0]) for frame in archive] == [30, 31, 32]
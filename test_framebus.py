@@ -0,0 +1,159 @@
+"""Tests of the shared-memory frame bus."""
+
+import subprocess
+import sys
+import uuid
+import numpy as np
+import pytest
+from framebus import FramePublisher, FrameSubscriber, FrameBusOverrun, FrameBusClosed
+
+SHAPE = (4, 5, 3)
+
+
+def frame(value, shape=SHAPE):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+@pytest.fixture
+def bus_name():
+    return "test_bus_" + uuid.uuid4().hex[:8]
+
+
+@pytest.fixture
+def publisher(bus_name):
+    bus = FramePublisher(SHAPE, name=bus_name, slots=3)
+    yield bus
+    if bus._header is not None:  # pylint: disable=W0212
+        bus.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_reads_in_order(publisher, bus_name):
+    subscriber = FrameSubscriber(bus_name)
+    assert subscriber.read() == (0, None)
+
+    publisher.publish(frame(1))
+    publisher.publish(frame(2))
+    for expected in (1, 2):
+        seq, data = subscriber.read()
+        assert seq == expected
+        assert (data == expected).all()
+        assert subscriber.is_valid(seq)
+    assert subscriber.read() == (0, None)
+    subscriber.close()
+
+
+def test_overrun_and_resync(publisher, bus_name):
+    subscriber = FrameSubscriber(bus_name)
+    for i in range(1, 7):
+        publisher.publish(frame(i))
+
+    with pytest.raises(FrameBusOverrun) as overrun:
+        subscriber.read()
+    assert overrun.value.expected == 1
+    assert overrun.value.latest == 6
+    assert overrun.value.dropped == 5
+
+    seq, data = subscriber.read()
+    assert seq == 6 and (data == 6).all()
+    assert subscriber.read() == (0, None)
+
+    # the view of an overwritten slot is detected as invalid
+    for i in range(7, 10):
+        publisher.publish(frame(i))
+    assert not subscriber.is_valid(6)
+    subscriber.close()
+
+
+def test_read_latest(publisher, bus_name):
+    subscriber = FrameSubscriber(bus_name)
+    publisher.publish(frame(1))
+    publisher.publish(frame(2))
+    seq, data = subscriber.read_latest(copy=True)
+    assert seq == 2 and (data == 2).all()
+    assert subscriber.read_latest() == (0, None)
+    subscriber.close()
+
+
+def test_closed_bus(publisher, bus_name):
+    subscriber = FrameSubscriber(bus_name)
+    publisher.publish(frame(1))
+    publisher.close()
+    with pytest.raises(FrameBusClosed):
+        subscriber.read()
+    subscriber.close()
+
+
+def test_live_bus_is_not_replaced(publisher, bus_name):
+    with pytest.raises(FileExistsError):
+        FramePublisher(SHAPE, name=bus_name)
+
+    subscriber = FrameSubscriber(bus_name)
+    publisher.publish(frame(1))
+    assert subscriber.read()[0] == 1
+    subscriber.close()
+
+
+def test_stale_bus_is_replaced(publisher, bus_name):
+    subscriber = FrameSubscriber(bus_name)
+    publisher._header[6] = dead_pid()  # pylint: disable=W0212
+
+    replacement = FramePublisher(SHAPE, name=bus_name)
+    with pytest.raises(FrameBusClosed):
+        subscriber.read()
+    subscriber.close()
+
+    subscriber = FrameSubscriber(bus_name)
+    replacement.publish(frame(5))
+    assert subscriber.read()[0] == 1
+    subscriber.close()
+    replacement.close()
+    publisher._release()  # pylint: disable=W0212
+
+
+def test_foreign_block_is_not_removed(bus_name):
+    # a shared memory block of another process that is not a frame bus
+    owner = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys\n"
+         "from multiprocessing import shared_memory\n"
+         "block = shared_memory.SharedMemory(name=sys.argv[1], create=True, size=4096)\n"
+         "print('ready', flush=True)\n"
+         "sys.stdin.read()\n"
+         "block.close()\n"
+         "block.unlink()\n",
+         bus_name],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert owner.stdout.readline().strip() == "ready"
+        with pytest.raises(FileExistsError):
+            FramePublisher(SHAPE, name=bus_name)
+        with pytest.raises(ValueError):
+            FrameSubscriber(bus_name)
+    finally:
+        owner.stdin.close()
+        owner.wait()
+    assert owner.returncode == 0
+
+
+def test_grayscale_frames_and_alignment(bus_name):
+    publisher = FramePublisher((3, 3), name=bus_name, slots=4)
+    try:
+        assert all(seq.flags.aligned for seq in publisher._slot_seq)  # pylint: disable=W0212
+
+        subscriber = FrameSubscriber(bus_name)
+        assert subscriber.shape == (3, 3)
+        publisher.publish(frame(7, (3, 3)))
+        seq, data = subscriber.read(copy=True)
+        assert seq == 1 and data.shape == (3, 3) and (data == 7).all()
+        subscriber.close()
+
+        with pytest.raises(ValueError):
+            publisher.publish(frame(1))
+    finally:
+        publisher.close()
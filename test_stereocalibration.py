@@ -0,0 +1,113 @@
+"""Tests of the stereo calibration."""
+
+import numpy as np
+import cv2
+import pytest
+from calibration import CameraCalibration
+from stereocalibration import StereoCalibration
+
+IMAGE_SIZE = (640, 480)
+CAMERA_MATRIX = np.array([[500.0, 0.0, 320.0], [0.0, 500.0, 240.0], [0.0, 0.0, 1.0]])
+BASELINE = np.array([[-2.0], [0.0], [0.0]])
+SQUARE = 40
+MARGIN = 40
+
+
+def chessboard():
+    """Chessboard texture with 9x6 inner corners and a white margin."""
+    squares = (np.indices((7, 10)).sum(axis=0) % 2 * 255).astype(np.uint8)
+    board = np.kron(squares, np.ones((SQUARE, SQUARE), dtype=np.uint8))
+    return cv2.copyMakeBorder(board, MARGIN, MARGIN, MARGIN, MARGIN,
+                              cv2.BORDER_CONSTANT, value=255)
+
+
+def render(board, rotation, translation):
+    """Render the chessboard seen by a camera with the given board pose."""
+    # texture pixels to chessboard units, the first inner corner is the origin
+    offset = MARGIN / SQUARE + 1
+    texture_to_board = np.array([[1 / SQUARE, 0, -offset], [0, 1 / SQUARE, -offset], [0, 0, 1]])
+    board_to_image = CAMERA_MATRIX @ np.column_stack(
+        (rotation[:, 0], rotation[:, 1], translation.ravel()))
+    image = cv2.warpPerspective(board, board_to_image @ texture_to_board, IMAGE_SIZE,
+                                borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def stereo_pairs(count):
+    """Synchronized frame pairs of a rig with a horizontal baseline."""
+    board = chessboard()
+    rng = np.random.default_rng(1)
+    for _ in range(count):
+        rotation = cv2.Rodrigues(rng.uniform(-0.3, 0.3, 3))[0]
+        translation = np.array([[-3.0 + rng.uniform(-1, 1)],
+                                [-2.5 + rng.uniform(-1, 1)],
+                                [22.0 + rng.uniform(-3, 3)]])
+        yield [render(board, rotation, translation),
+               render(board, rotation, translation + BASELINE)]
+
+
+def camera():
+    calibration = CameraCalibration()
+    calibration.set_calibration(CAMERA_MATRIX.copy(), np.zeros((1, 5)))
+    return calibration
+
+
+@pytest.fixture
+def stereo():
+    calibration = StereoCalibration([camera(), camera()])
+    calibration.record_min_num_frames = 8
+    yield calibration
+    calibration.close()
+
+
+def test_solve_rectify_save_and_load(stereo, tmp_path):
+    fired = []
+    stereo.calibrated += lambda: fired.append(stereo.is_calibrated)
+    stereo.start_calibration()
+    for frames in stereo_pairs(12):
+        stereo.calibrate(frames)
+        if not stereo.is_calibrating:
+            break
+
+    assert fired == [True]
+    extrinsics = stereo.extrinsics[1]
+    assert np.allclose(extrinsics["T"], BASELINE, atol=0.05)
+    assert np.allclose(extrinsics["R"], np.eye(3), atol=0.01)
+
+    frames = next(stereo_pairs(1))
+    left, right = stereo.rectify(*frames)
+    assert left.shape == right.shape == frames[0].shape
+    assert stereo.disparity_to_depth().shape == (4, 4)
+    with pytest.raises(ValueError):
+        stereo.rectify(frames[0][:240, :320], frames[1][:240, :320])
+
+    pathname = str(tmp_path / "stereo.json")
+    stereo.save_calibration(pathname)
+    loaded = StereoCalibration([CameraCalibration(), CameraCalibration()])
+    loaded.load_calibration(pathname)
+    assert loaded.is_calibrated
+    assert np.allclose(loaded.extrinsics[1]["T"], extrinsics["T"])
+    assert np.allclose(loaded.calibrations[1].camera_matrix, CAMERA_MATRIX)
+    assert np.array_equal(loaded.rectify(*frames)[1], right)
+    loaded.close()
+
+
+def test_failed_solve_fires_calibrated(stereo):
+    fired = []
+    stereo.calibrated += lambda: fired.append(stereo.is_calibrated)
+    assert stereo.disparity_to_depth() is None
+
+    stereo.start_calibration()
+    # corner lists that do not match the object points make the solver fail
+    corners = np.zeros((10, 1, 2), dtype=np.float32)
+    for _ in range(stereo.record_min_num_frames):
+        stereo.obj_points.append(stereo.calibrations[0].objp)
+        stereo.img_points[0].append(corners)
+        stereo.img_points[1].append(corners)
+    stereo.record_cnt = stereo.record_min_num_frames
+
+    stereo.calibrate(next(stereo_pairs(1)))
+    assert fired == [False]
+    assert not stereo.is_calibrating
+    assert not stereo.is_calibrated
+    assert stereo.record_cnt == 0 and not stereo.obj_points
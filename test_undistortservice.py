@@ -0,0 +1,82 @@
+"""Tests of the local undistortion service."""
+
+import asyncio
+import json
+import os
+import numpy as np
+import pytest
+from calibration import CameraCalibration
+from undistortservice import UndistortService, UndistortClient, _encode, _LENGTH
+
+PROFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "camera.json")
+
+
+def run_with_service(client_test):
+    """Start the service on a free localhost port and run a blocking client test."""
+    async def run():
+        service = UndistortService(workers=2)
+        await service.start(port=0)
+        try:
+            port = service.address[1]
+            await asyncio.get_running_loop().run_in_executor(None, client_test, port)
+        finally:
+            await service.close()
+    asyncio.run(run())
+
+
+def reference_undistort(frame):
+    calibration = CameraCalibration()
+    calibration.load_calibration(PROFILE)
+    return calibration.undistort(frame)
+
+
+def test_undistort_single_frame_and_batch():
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8),
+              rng.integers(0, 256, (240, 320, 3), dtype=np.uint8),
+              rng.integers(0, 256, (480, 640), dtype=np.uint8)]
+
+    def client_test(port):
+        client = UndistortClient(port=port)
+        try:
+            result = client.undistort(PROFILE, frames[0])
+            assert np.array_equal(result, reference_undistort(frames[0]))
+
+            results = client.undistort_batch(PROFILE, frames)
+            assert len(results) == len(frames)
+            for frame, result in zip(frames, results):
+                assert np.array_equal(result, reference_undistort(frame))
+
+            stats = client.stats()
+            assert stats["requests"] == 2
+            assert stats["frames"] == 4
+            assert stats["profiles"] == 1
+            assert stats["queue_depth"] == 0
+        finally:
+            client.close()
+
+    run_with_service(client_test)
+
+
+def test_request_errors_keep_connection():
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def client_test(port):
+        client = UndistortClient(port=port)
+        try:
+            with pytest.raises(ValueError):
+                client.undistort(PROFILE, frame.astype(np.uint16))
+            with pytest.raises(RuntimeError):
+                client.undistort(PROFILE + ".missing", frame)
+
+            # malformed frame shapes are reported, not fatal
+            # pylint: disable=W0212
+            client._socket.sendall(_encode(
+                {"op": "undistort", "profile": PROFILE, "frames": [[48, "64"]]}, b"x"))
+            length = _LENGTH.unpack(client._receive(_LENGTH.size))[0]
+            assert json.loads(client._receive(length))["status"] == "error"
+            assert client.undistort(PROFILE, frame).shape == frame.shape
+        finally:
+            client.close()
+
+    run_with_service(client_test)
@@ -0,0 +1,331 @@
+"""A local service undistorting frames with warm calibration profiles.
+
+Tools that need undistorted images connect to the service instead of loading
+a calibration file and building undistortion maps for every image. The service
+keeps every calibration profile it has loaded, together with its undistortion
+maps, and processes single frames or batches on a worker pool.
+
+The service listens on a Unix socket or on a localhost TCP port. Every message
+is a 4-byte big-endian length, a JSON header of that length and, if the header
+has a "size" field, that many bytes of frame data. Frames are 8-bit images
+packed one after another; their shapes are listed in the "frames" header field.
+
+Requests:
+    {"op": "undistort", "profile": path, "frames": [shape, ...], "size": n}
+    {"op": "stats"}
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from calibration import CameraCalibration
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+LATENCY_WINDOW = 100
+
+_LENGTH = struct.Struct("!I")
+
+
+def _pack_frames(frames):
+    """Pack 8-bit frames into a list of shapes and a byte string."""
+    for frame in frames:
+        if frame.dtype != np.uint8:
+            raise ValueError(f"Only 8-bit frames can be sent, got {frame.dtype}.")
+    shapes = [list(frame.shape) for frame in frames]
+    payload = b"".join(np.ascontiguousarray(frame).tobytes() for frame in frames)
+    return shapes, payload
+
+
+def _unpack_frames(shapes, payload):
+    """Unpack 8-bit frames packed with _pack_frames()."""
+    if not isinstance(shapes, list):
+        raise ValueError("Frame shapes must be a list.")
+
+    frames = []
+    offset = 0
+    for shape in shapes:
+        if not isinstance(shape, list) or len(shape) not in (2, 3) or \
+                not all(isinstance(x, int) and x > 0 for x in shape):
+            raise ValueError(f"Invalid frame shape {shape}.")
+        size = int(np.prod(shape))
+        if offset + size > len(payload):
+            raise ValueError("Frame data is shorter than the frame shapes.")
+        frames.append(np.frombuffer(payload, np.uint8, size, offset).reshape(shape))
+        offset += size
+    if offset != len(payload):
+        raise ValueError("Frame data is longer than the frame shapes.")
+    return frames
+
+
+def _encode(header, payload=b""):
+    """Encode a message."""
+    if payload:
+        header = dict(header, size=len(payload))
+    data = json.dumps(header).encode("utf-8")
+    return _LENGTH.pack(len(data)) + data + payload
+
+
+class UndistortService():
+    """This class undistorts frames with cached calibration profiles."""
+
+    def __init__(self, workers=None):
+        """Create the service.
+
+        Args:
+            workers (int): Number of worker threads. Default is the number of CPUs.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._profiles = {}
+        self._queue_depth = 0
+        self._requests = 0
+        self._frames = 0
+        self._latency = collections.deque(maxlen=LATENCY_WINDOW)
+        self._server = None
+
+    @property
+    def queue_depth(self):
+        """Number of frames waiting for or being processed by the workers."""
+        return self._queue_depth
+
+    @property
+    def stats(self):
+        """Service statistics."""
+        latency = list(self._latency)
+        return {
+            "queue_depth": self._queue_depth,
+            "requests": self._requests,
+            "frames": self._frames,
+            "profiles": len(self._profiles),
+            "mean_latency_ms": 1000 * sum(latency) / len(latency) if latency else 0,
+            "max_latency_ms": 1000 * max(latency) if latency else 0
+            }
+
+    def profile(self, pathname):
+        """Get a calibration profile, loading it when it is used for the first time
+        or when the calibration file has been changed.
+
+        Args:
+            pathname (str): Calibration file.
+        Returns:
+            calibrated CameraCalibration instance.
+        """
+        pathname = os.path.abspath(pathname)
+        mtime = os.path.getmtime(pathname)
+        cached = self._profiles.get(pathname)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        calibration = CameraCalibration()
+        calibration.load_calibration(pathname)
+        self._profiles[pathname] = (mtime, calibration)
+        return calibration
+
+    async def undistort(self, pathname, frames):
+        """Undistort a batch of frames on the worker pool.
+
+        Args:
+            pathname (str): Calibration file.
+            frames (list): Input images.
+        Returns:
+            list of undistorted frames.
+        """
+        calibration = self.profile(pathname)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self._queue_depth += len(frames)
+        try:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(self._executor, calibration.undistort, frame)
+                for frame in frames])
+        finally:
+            self._queue_depth -= len(frames)
+
+        self._latency.append(time.perf_counter() - start)
+        self._requests += 1
+        self._frames += len(frames)
+        return results
+
+    async def _dispatch(self, header, payload):
+        """Process a request and return a response message."""
+        op = header.get("op")
+        if op == "stats":
+            return _encode(dict(self.stats, status="ok"))
+        if op == "undistort":
+            frames = _unpack_frames(header["frames"], payload)
+            shapes, data = _pack_frames(await self.undistort(header["profile"], frames))
+            return _encode({"status": "ok", "frames": shapes}, data)
+        raise ValueError(f"Unknown operation '{op}'.")
+
+    async def _handle_connection(self, reader, writer):
+        """Serve requests of a client until it disconnects."""
+        try:
+            while True:
+                try:
+                    length = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))[0]
+                    data = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    header = json.loads(data)
+                    if not isinstance(header, dict):
+                        raise ValueError("Request header must be a JSON object.")
+                    size = header.get("size", 0)
+                    if not isinstance(size, int) or size < 0:
+                        raise ValueError(f"Invalid frame data size {size}.")
+                except ValueError as error:
+                    # the end of the message is unknown, so the connection cannot be used further
+                    writer.write(_encode({"status": "error", "message": str(error)}))
+                    await writer.drain()
+                    break
+
+                try:
+                    payload = await reader.readexactly(size)
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    response = await self._dispatch(header, payload)
+                except Exception as error:  # pylint: disable=W0703
+                    # report any failure of a request to the client, e.g. cv2.error
+                    response = _encode({"status": "error", "message": str(error)})
+                writer.write(response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT, path=None):
+        """Start listening for clients.
+
+        Args:
+            host (str): Host to listen on. Default is localhost.
+            port (int): TCP port. Use 0 to pick a free port.
+            path (str): Unix socket path. If set, host and port are ignored.
+        Returns:
+            asyncio server.
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, path)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    @property
+    def address(self):
+        """Address the service is listening on."""
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        """Stop listening and shut down the worker pool."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self._executor.shutdown()
+
+
+class UndistortClient():
+    """This class sends frames to an undistortion service."""
+
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT, path=None):
+        """Connect to the service.
+
+        Args:
+            host (str): Service host. Default is localhost.
+            port (int): Service TCP port.
+            path (str): Unix socket path. If set, host and port are ignored.
+        """
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port))
+
+    def _receive(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Undistortion service closed the connection.")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _request(self, header, payload=b""):
+        self._socket.sendall(_encode(header, payload))
+        length = _LENGTH.unpack(self._receive(_LENGTH.size))[0]
+        response = json.loads(self._receive(length))
+        data = self._receive(response.get("size", 0))
+        if response.get("status") != "ok":
+            raise RuntimeError(response.get("message", "Undistortion service error."))
+        return response, data
+
+    def undistort(self, pathname, frame):
+        """Undistort a frame.
+
+        Args:
+            pathname (str): Calibration file, as seen by the service.
+            frame (image): 8-bit input image.
+        Returns:
+            undistorted frame of the same size as the original one.
+        """
+        return self.undistort_batch(pathname, [frame])[0]
+
+    def undistort_batch(self, pathname, frames):
+        """Undistort a batch of frames.
+
+        Args:
+            pathname (str): Calibration file, as seen by the service.
+            frames (list): 8-bit input images.
+        Returns:
+            list of undistorted frames.
+        """
+        shapes, payload = _pack_frames(frames)
+        response, data = self._request(
+            {"op": "undistort", "profile": os.path.abspath(pathname), "frames": shapes},
+            payload)
+        return _unpack_frames(response["frames"], data)
+
+    def stats(self):
+        """Get service statistics: queue depth, processed frames and latency."""
+        response, _ = self._request({"op": "stats"})
+        del response["status"]
+        return response
+
+    def close(self):
+        """Close the connection."""
+        self._socket.close()
+
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, path=None, workers=None):
+    """Run the undistortion service until it is cancelled."""
+    service = UndistortService(workers)
+    server = await service.start(host, port, path)
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    """Start the undistortion service from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=SERVICE_HOST, help="host to listen on")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="TCP port")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("--workers", type=int, help="number of worker threads")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()